@@ -187,7 +187,7 @@ class PupperV3Env(PipelineEnv):
         super().__init__(sys, backend="mjx", n_frames=n_frames)
 
         self._reward_config = reward_config
-        self._torso_geom_ids = body_name_to_geom_ids(sys.mj_model, torso_name)
+        self._torso_geom_ids = jp.asarray(body_name_to_geom_ids(sys.mj_model, torso_name))
         self._torso_idx = mujoco.mj_name2id(
             sys.mj_model, mujoco.mjtObj.mjOBJ_BODY.value, torso_name
         )
@@ -208,10 +208,13 @@ class PupperV3Env(PipelineEnv):
             mujoco.mj_name2id(sys.mj_model, mujoco.mjtObj.mjOBJ_SITE.value, f) for f in feet_site
         ]
         assert not any(id_ == -1 for id_ in feet_site_id), "Site not found."
-        self._feet_site_id = np.array(feet_site_id)
+        self._feet_site_id = jp.asarray(feet_site_id)
 
-        self._lower_leg_body_id = body_names_to_body_ids(sys.mj_model, lower_leg_body_names)
-        self._upper_leg_geom_ids = body_names_to_geom_ids(sys.mj_model, upper_leg_body_names)
+        lower_leg_body_id = body_names_to_body_ids(sys.mj_model, lower_leg_body_names)
+        self._foot_indices = jp.asarray(lower_leg_body_id - 1)  # x and xd exclude the world body
+        self._upper_leg_geom_ids = jp.asarray(
+            body_names_to_geom_ids(sys.mj_model, upper_leg_body_names)
+        )
 
         self._foot_radius = foot_radius
         self._nv = sys.nv
@@ -254,6 +257,21 @@ class PupperV3Env(PipelineEnv):
         # whether to use imu
         self._use_imu = use_imu
 
+        # reward terms with zero scale are left out of the compiled step
+        self._compute_rewards = rewards.make_reward_fn(
+            self._reward_config.rewards.scales,
+            tracking_sigma=self._reward_config.rewards.tracking_sigma,
+            dt=self._dt,
+            default_pose=self._default_pose,
+            desired_abduction_angles=self._desired_abduction_angles,
+            stand_still_command_threshold=self._stand_still_command_threshold,
+            termination_step_threshold=self._early_termination_step_threshold,
+            feet_site_id=self._feet_site_id,
+            foot_indices=self._foot_indices,
+            knee_geom_ids=self._upper_leg_geom_ids,
+            body_geom_ids=self._torso_geom_ids,
+        )
+
     def sample_command(self, rng: jax.Array) -> jax.Array:
         """
         Sample random command with desired linear and angular velocity ranges.
@@ -346,7 +364,7 @@ class PupperV3Env(PipelineEnv):
             "last_act": jp.zeros(12, dtype=float),
             "action_buffer": self.initial_action_buffer(),
             "imu_buffer": self.initial_imu_buffer(),
-            "last_vel": jp.zeros(12, dtype=float),
+            "last_vel": jp.zeros(12, dtype=jp.bfloat16),
             "command": self.sample_command(sample_command_key),
             "last_contact": jp.zeros(4, dtype=bool),
             "feet_air_time": jp.zeros(4, dtype=float),
@@ -393,7 +411,7 @@ class PupperV3Env(PipelineEnv):
         motor_targets = self._default_pose + lagged_action * self._action_scale
         motor_targets = jp.clip(motor_targets, self.lowers, self.uppers)
         pipeline_state = self.pipeline_step(state.pipeline_state, motor_targets)
-        x, xd = pipeline_state.x, pipeline_state.xd
+        x = pipeline_state.x
 
         # Observation data
         obs = self._get_obs(pipeline_state, state.info, state.obs)
@@ -419,80 +437,33 @@ class PupperV3Env(PipelineEnv):
         done |= pipeline_state.x.pos[self._torso_idx - 1, 2] < self._terminal_body_z
 
         # Reward
-        rewards_dict = {
-            "tracking_lin_vel": rewards.reward_tracking_lin_vel(
-                state.info["command"],
-                x,
-                xd,
-                tracking_sigma=self._reward_config.rewards.tracking_sigma,
-            ),
-            "tracking_ang_vel": rewards.reward_tracking_ang_vel(
-                state.info["command"],
-                x,
-                xd,
-                tracking_sigma=self._reward_config.rewards.tracking_sigma,
-            ),
-            "tracking_orientation": rewards.reward_tracking_orientation(
-                state.info["desired_world_z_in_body_frame"],
-                x,
-                tracking_sigma=self._reward_config.rewards.tracking_sigma,
-            ),
-            "lin_vel_z": rewards.reward_lin_vel_z(xd),
-            "ang_vel_xy": rewards.reward_ang_vel_xy(xd),
-            "orientation": rewards.reward_orientation(x),
-            "torques": rewards.reward_torques(
-                pipeline_state.qfrc_actuator
-            ),  # pytype: disable=attribute-error
-            "joint_acceleration": rewards.reward_joint_acceleration(
-                joint_vel, state.info["last_vel"], dt=self._dt
-            ),
-            "mechanical_work": rewards.reward_mechanical_work(
-                pipeline_state.qfrc_actuator[6:], pipeline_state.qvel[6:]
-            ),
-            "action_rate": rewards.reward_action_rate(action, state.info["last_act"]),
-            "stand_still": rewards.reward_stand_still(
-                state.info["command"], joint_angles, self._default_pose, 0.1
-            ),
-            "stand_still_joint_velocity": rewards.reward_stand_still(
-                state.info["command"], joint_vel, jp.zeros(12), self._stand_still_command_threshold
-            ),
-            "abduction_angle": rewards.reward_abduction_angle(
-                joint_angles,
-                desired_abduction_angles=self._desired_abduction_angles,
-            ),
-            "feet_air_time": rewards.reward_feet_air_time(
-                state.info["feet_air_time"],
-                first_contact,
-                state.info["command"],
-            ),
-            "foot_slip": rewards.reward_foot_slip(
-                pipeline_state,
-                contact_filt_cm,
-                feet_site_id=self._feet_site_id,
-                lower_leg_body_id=self._lower_leg_body_id,
-            ),
-            "termination": rewards.reward_termination(
-                done,
-                state.info["step"],
-                step_threshold=self._early_termination_step_threshold,
-            ),
-            "knee_collision": rewards.reward_geom_collision(
-                pipeline_state, self._upper_leg_geom_ids
-            ),
-            "body_collision": rewards.reward_geom_collision(pipeline_state, self._torso_geom_ids),
-        }
-        rewards_dict = {
-            k: v * self._reward_config.rewards.scales[k] for k, v in rewards_dict.items()
-        }
+        rewards_dict = self._compute_rewards(
+            pipeline_state,
+            action=action,
+            last_act=state.info["last_act"],
+            joint_angles=joint_angles,
+            joint_vel=joint_vel,
+            last_joint_vel=state.info["last_vel"],
+            commands=state.info["command"],
+            desired_world_z_in_body_frame=state.info["desired_world_z_in_body_frame"],
+            feet_air_time=state.info["feet_air_time"],
+            first_contact=first_contact,
+            contact_filt=contact_filt_cm,
+            done=done,
+            step=state.info["step"],
+        )
         # Clip individual rewards to prevent extreme values
         rewards_dict = {k: jp.clip(v, -1000.0, 1000.0) for k, v in rewards_dict.items()}
-        # Sum rewards and clip final value
-        reward = jp.clip(sum(rewards_dict.values()) * self.dt, 0.0, 10000.0)
+        # Sum rewards, zero out a NaN from a diverged step once here rather than per term, and
+        # clip final value
+        reward = jp.nan_to_num(sum(rewards_dict.values()) * self.dt, nan=0.0)
+        reward = jp.clip(reward, 0.0, 10000.0)
 
         # State management
         state.info["kick"] = kick
         state.info["last_act"] = action
-        state.info["last_vel"] = joint_vel
+        # Only read by the joint acceleration reward, so stored in bf16 to halve its traffic
+        state.info["last_vel"] = joint_vel.astype(jp.bfloat16)
         state.info["feet_air_time"] *= ~contact_filt_mm
         state.info["last_contact"] = contact
         state.info["rewards"] = rewards_dict
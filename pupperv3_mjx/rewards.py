@@ -1,36 +1,59 @@
 import jax
 from jax import numpy as jp
-from brax.base import Motion, Transform
-from brax import base, math
+from brax import base
 import numpy as np
+from typing import Callable, Dict, Optional
 
 EPS = 1e-6
+# Constants are numpy arrays so importing this module does not initialize a JAX backend
+_WORLD_Z = np.array([0.0, 0.0, 1.0])
+_ZERO_ABDUCTION = np.zeros(4)
+# Abduction joints in the 12-dof joint vector. A static strided slice lowers to an HLO slice,
+# not a gather, so it fuses with the surrounding elementwise ops.
+_ABDUCTION_JOINTS = slice(1, None, 3)
+
+
+def _sq_norm(v: jax.Array) -> jax.Array:
+    """Sum of squares of a 1-D vector as a single dot, without materializing the squares."""
+    return jp.dot(v, v)
+
+
+def _qrot(q: jax.Array, v: jax.Array) -> jax.Array:
+    """Rotate v by unit quaternion q [w, x, y, z]. Expanded form of math.rotate."""
+    t = 2.0 * jp.cross(q[1:], v)
+    return v + q[0] * t + jp.cross(q[1:], t)
+
+
+def _qrot_inv(q: jax.Array, v: jax.Array) -> jax.Array:
+    """Rotate v by the inverse of unit quaternion q, i.e. math.rotate(v, math.quat_inv(q))."""
+    t = 2.0 * jp.cross(v, q[1:])
+    return v + q[0] * t - jp.cross(q[1:], t)
+
+
 # ------------ reward functions----------------
-def reward_lin_vel_z(xd: Motion) -> jax.Array:
+def reward_lin_vel_z(base_vel: jax.Array) -> jax.Array:
     # Penalize z axis base linear velocity
-    return jp.clip(jp.square(xd.vel[0, 2]), -1000.0, 1000.0)
+    return jp.minimum(jp.square(base_vel[2]), 1000.0)
 
 
-def reward_ang_vel_xy(xd: Motion) -> jax.Array:
+def reward_ang_vel_xy(base_ang: jax.Array) -> jax.Array:
     # Penalize xy axes base angular velocity
-    return jp.clip(jp.sum(jp.square(xd.ang[0, :2])), -1000.0, 1000.0)
+    return jp.minimum(_sq_norm(base_ang[:2]), 1000.0)
 
 
 def reward_tracking_orientation(
-    desired_world_z_in_body_frame: jax.Array, x: Transform, tracking_sigma: float
+    desired_world_z_in_body_frame: jax.Array,
+    world_z_in_body_frame: jax.Array,
+    inv_tracking_sigma: float,
 ) -> jax.Array:
     # Tracking of desired body orientation
-    world_z = jp.array([0.0, 0.0, 1.0])
-    world_z_in_body_frame = math.rotate(world_z, math.quat_inv(x.rot[0]))
-    error = jp.sum(jp.square(world_z_in_body_frame - desired_world_z_in_body_frame))
-    return jp.clip(jp.exp(-error / (tracking_sigma + EPS)), -1000.0, 1000.0)
+    error = _sq_norm(world_z_in_body_frame - desired_world_z_in_body_frame)
+    return jp.exp(-error * inv_tracking_sigma)
 
 
-def reward_orientation(x: Transform) -> jax.Array:
+def reward_orientation(rot_up: jax.Array) -> jax.Array:
     # Penalize non flat base orientation
-    up = jp.array([0.0, 0.0, 1.0])
-    rot_up = math.rotate(up, x.rot[0])
-    return jp.clip(jp.sum(jp.square(rot_up[:2])), -1000.0, 1000.0)
+    return jp.minimum(_sq_norm(rot_up[:2]), 1000.0)
 
 
 def reward_torques(torques: jax.Array) -> jax.Array:
@@ -38,42 +61,41 @@ def reward_torques(torques: jax.Array) -> jax.Array:
     # This has a sparifying effect
     # return jp.sqrt(jp.sum(jp.square(torques))) + jp.sum(jp.abs(torques))
     # Use regular sum-squares like in LeggedGym
-    return jp.clip(jp.sum(jp.square(torques)), -1000.0, 1000.0)
+    return jp.minimum(_sq_norm(torques), 1000.0)
 
 
 def reward_joint_acceleration(
     joint_vel: jax.Array, last_joint_vel: jax.Array, dt: float
 ) -> jax.Array:
-    return jp.clip(jp.sum(jp.square((joint_vel - last_joint_vel) / (dt + EPS))), -1000.0, 1000.0)
+    # last_joint_vel may be stored in reduced precision, accumulate in joint_vel's dtype
+    joint_acc = (joint_vel - last_joint_vel.astype(joint_vel.dtype)) / (dt + EPS)
+    return jp.minimum(_sq_norm(joint_acc), 1000.0)
 
 
 def reward_mechanical_work(torques: jax.Array, velocities: jax.Array) -> jax.Array:
     # Penalize mechanical work
-    return jp.clip(jp.sum(jp.abs(torques * velocities)), -1000.0, 1000.0)
+    return jp.minimum(jp.sum(jp.abs(torques * velocities)), 1000.0)
 
 
 def reward_action_rate(act: jax.Array, last_act: jax.Array) -> jax.Array:
     # Penalize changes in actions
-    return jp.clip(jp.sum(jp.square(act - last_act)), -1000.0, 1000.0)
+    return jp.minimum(_sq_norm(act - last_act), 1000.0)
 
 
 def reward_tracking_lin_vel(
-    commands: jax.Array, x: Transform, xd: Motion, tracking_sigma
+    commands: jax.Array, local_vel: jax.Array, inv_tracking_sigma: float
 ) -> jax.Array:
     # Tracking of linear velocity commands (xy axes)
-    local_vel = math.rotate(xd.vel[0], math.quat_inv(x.rot[0]))
-    lin_vel_error = jp.sum(jp.square(commands[:2] - local_vel[:2]))
-    lin_vel_reward = jp.exp(-lin_vel_error / (tracking_sigma + EPS))
-    return jp.clip(lin_vel_reward, -1000.0, 1000.0)
+    lin_vel_error = _sq_norm(commands[:2] - local_vel[:2])
+    return jp.exp(-lin_vel_error * inv_tracking_sigma)
 
 
 def reward_tracking_ang_vel(
-    commands: jax.Array, x: Transform, xd: Motion, tracking_sigma
+    commands: jax.Array, base_ang_vel: jax.Array, inv_tracking_sigma: float
 ) -> jax.Array:
     # Tracking of angular velocity commands (yaw)
-    base_ang_vel = math.rotate(xd.ang[0], math.quat_inv(x.rot[0]))
     ang_vel_error = jp.square(commands[2] - base_ang_vel[2])
-    return jp.clip(jp.exp(-ang_vel_error / (tracking_sigma + EPS)), -1000.0, 1000.0)
+    return jp.exp(-ang_vel_error * inv_tracking_sigma)
 
 
 def reward_feet_air_time(
@@ -84,15 +106,20 @@ def reward_feet_air_time(
 ) -> jax.Array:
     # Reward air time.
     rew_air_time = jp.sum((air_time - minimum_airtime) * first_contact)
-    rew_air_time *= math.normalize(commands[:3])[1] > 0.05  # no reward for zero command
-    return jp.clip(rew_air_time, -1000.0, 1000.0)
+    # no reward for zero command, compare squared norm to skip the sqrt
+    rew_air_time *= _sq_norm(commands[:3]) > 0.05**2
+    # bounded below by -len(air_time) * minimum_airtime, so only the upper bound can bind
+    return jp.minimum(rew_air_time, 1000.0)
 
 
 def reward_abduction_angle(
-    joint_angles: jax.Array, desired_abduction_angles: jax.Array = jp.zeros(4)
+    joint_angles: jax.Array, desired_abduction_angles: Optional[jax.Array] = None
 ):
     # Penalize abduction angle
-    return jp.clip(jp.sum(jp.square(joint_angles[1::3] - desired_abduction_angles)), -1000.0, 1000.0)
+    if desired_abduction_angles is None:
+        desired_abduction_angles = _ZERO_ABDUCTION
+    abduction_angles = joint_angles[_ABDUCTION_JOINTS]
+    return jp.minimum(_sq_norm(abduction_angles - desired_abduction_angles), 1000.0)
 
 
 def reward_stand_still(
@@ -111,46 +138,167 @@ def reward_stand_still(
     """
 
     # Penalize motion at zero commands
-    return jp.clip(
-        jp.sum(jp.abs(joint_angles - default_pose)) * (
-            math.normalize(commands[:3])[1] < command_threshold
-        ),
-        -1000.0,
-        1000.0
+    return jp.minimum(
+        jp.sum(jp.abs(joint_angles - default_pose))
+        * (_sq_norm(commands[:3]) < command_threshold * command_threshold),
+        1000.0,
     )
 
 
 def reward_foot_slip(
     pipeline_state: base.State,
     contact_filt: jax.Array,
-    feet_site_id: np.array,
-    lower_leg_body_id: np.array,
+    feet_site_id: jax.Array,
+    foot_indices: jax.Array,
 ) -> jax.Array:
     # get velocities at feet which are offset from lower legs
-    # pytype: disable=attribute-error
-    pos = pipeline_state.site_xpos[feet_site_id]  # feet position
-    feet_offset = pos - pipeline_state.xpos[lower_leg_body_id]
-    # pytype: enable=attribute-error
-    offset = base.Transform.create(pos=feet_offset)
-    foot_indices = lower_leg_body_id - 1  # we got rid of the world body
-    foot_vel = offset.vmap().do(pipeline_state.xd.take(foot_indices)).vel
+    # foot_indices are the lower leg body ids minus one since x and xd exclude the world body
+    pos = pipeline_state.site_xpos[feet_site_id]  # pytype: disable=attribute-error
+    feet_offset = pos - pipeline_state.x.pos[foot_indices]
+    body_xd = pipeline_state.xd.take(foot_indices)
+    # velocity of a point offset from the body origin: v + w x r
+    foot_vel_xy = body_xd.vel[:, :2] + jp.cross(body_xd.ang, feet_offset)[:, :2]
     # Penalize large feet velocity for feet that are in contact with the ground.
-    return jp.clip(
-        jp.sum(jp.square(foot_vel[:, :2]) * contact_filt.reshape((-1, 1))),
-        -1000.0,
-        1000.0
+    # contact-masked sum of squares as one reduction, without a (feet, 2) temporary
+    slip = jp.einsum(
+        "fc,fc,f->", foot_vel_xy, foot_vel_xy, contact_filt.astype(foot_vel_xy.dtype)
     )
+    return jp.minimum(slip, 1000.0)
 
 
 def reward_termination(done: jax.Array, step: jax.Array, step_threshold: int) -> jax.Array:
     return done & (step < step_threshold)
 
 
-def reward_geom_collision(pipeline_state: base.State, geom_ids: np.array) -> jax.Array:
-    contact = jp.array(0.0)
-    for id in geom_ids:
-        contact += jp.sum(
-            ((pipeline_state.contact.geom1 == id) | (pipeline_state.contact.geom2 == id))
-            * (pipeline_state.contact.dist < 0.0)
-        )
-    return jp.clip(contact, -1000.0, 1000.0)
+def reward_geom_collision(pipeline_state: base.State, geom_ids: jax.Array) -> jax.Array:
+    # Count penetrating contacts involving each geom in geom_ids as one (ncon, G) comparison
+    geom1_hit = pipeline_state.contact.geom1[:, None] == geom_ids[None, :]
+    geom2_hit = pipeline_state.contact.geom2[:, None] == geom_ids[None, :]
+    penetrating = pipeline_state.contact.dist[:, None] < 0.0
+    contact = jp.sum((geom1_hit | geom2_hit) & penetrating, dtype=float)
+    return jp.minimum(contact, 1000.0)
+
+
+# ------------ fused reward computation ----------------
+def make_reward_fn(
+    scales: Dict[str, float],
+    tracking_sigma: float,
+    dt: float,
+    default_pose: jax.Array,
+    desired_abduction_angles: jax.Array,
+    stand_still_command_threshold: float,
+    termination_step_threshold: int,
+    feet_site_id: jax.Array,
+    foot_indices: jax.Array,
+    knee_geom_ids: jax.Array,
+    body_geom_ids: jax.Array,
+) -> Callable[..., Dict[str, jax.Array]]:
+    """
+    Build the function computing all scaled reward terms for one environment step.
+
+    Terms whose scale is zero are resolved here in Python and return a constant zero, so
+    they never enter the traced graph. The remaining terms share the torso-frame quantities
+    (local linear and angular velocity, world z in the body frame) which are computed once,
+    letting the whole reward bundle trace into a single elementwise graph that XLA can fuse.
+
+    Args:
+        scales (Dict[str, float]): Reward scale for each term.
+        tracking_sigma (float): Sigma of the exponential tracking rewards.
+        dt (float): The environment timestep.
+        default_pose (jax.Array): The default joint pose.
+        desired_abduction_angles (jax.Array): The desired abduction angles.
+        stand_still_command_threshold (float): Command norm below which joint motion is
+            penalized.
+        termination_step_threshold (int): Terminations before this step are penalized.
+        feet_site_id (jax.Array): Site ids of the feet.
+        foot_indices (jax.Array): Indices of the lower legs into pipeline_state.x and xd,
+            i.e. their body ids minus one for the world body.
+        knee_geom_ids (jax.Array): Geom ids penalized for knee collisions.
+        body_geom_ids (jax.Array): Geom ids penalized for body collisions.
+
+    Returns:
+        Callable: compute_rewards(pipeline_state, action, last_act, joint_angles, joint_vel,
+        last_joint_vel, commands, desired_world_z_in_body_frame, feet_air_time,
+        first_contact, contact_filt, done, step) returning each reward term multiplied by
+        its scale.
+    """
+    scales = {k: float(v) for k, v in scales.items()}
+    active = {k: v for k, v in scales.items() if v != 0.0}
+    # Python float so the tracking rewards multiply by an HLO constant instead of dividing
+    inv_tracking_sigma = 1.0 / (float(tracking_sigma) + EPS)
+
+    def compute_rewards(
+        pipeline_state: base.State,
+        action: jax.Array,
+        last_act: jax.Array,
+        joint_angles: jax.Array,
+        joint_vel: jax.Array,
+        last_joint_vel: jax.Array,
+        commands: jax.Array,
+        desired_world_z_in_body_frame: jax.Array,
+        feet_air_time: jax.Array,
+        first_contact: jax.Array,
+        contact_filt: jax.Array,
+        done: jax.Array,
+        step: jax.Array,
+    ) -> Dict[str, jax.Array]:
+        # Slice the root body out of the Transform / Motion pytrees once
+        rot0 = pipeline_state.x.rot[0]
+        vel0 = pipeline_state.xd.vel[0]
+        ang0 = pipeline_state.xd.ang[0]
+        local_vel = _qrot_inv(rot0, vel0)
+        base_ang_vel = _qrot_inv(rot0, ang0)
+        world_z_in_body_frame = _qrot_inv(rot0, _WORLD_Z)
+        rot_up = _qrot(rot0, _WORLD_Z)
+
+        # Terms are thunks so that disabled ones are never traced
+        terms = {
+            "tracking_lin_vel": lambda: reward_tracking_lin_vel(
+                commands, local_vel, inv_tracking_sigma
+            ),
+            "tracking_ang_vel": lambda: reward_tracking_ang_vel(
+                commands, base_ang_vel, inv_tracking_sigma
+            ),
+            "tracking_orientation": lambda: reward_tracking_orientation(
+                desired_world_z_in_body_frame, world_z_in_body_frame, inv_tracking_sigma
+            ),
+            "lin_vel_z": lambda: reward_lin_vel_z(vel0),
+            "ang_vel_xy": lambda: reward_ang_vel_xy(ang0),
+            "orientation": lambda: reward_orientation(rot_up),
+            "torques": lambda: reward_torques(
+                pipeline_state.qfrc_actuator
+            ),  # pytype: disable=attribute-error
+            "joint_acceleration": lambda: reward_joint_acceleration(
+                joint_vel, last_joint_vel, dt=dt
+            ),
+            "mechanical_work": lambda: reward_mechanical_work(
+                pipeline_state.qfrc_actuator[6:], pipeline_state.qvel[6:]
+            ),
+            "action_rate": lambda: reward_action_rate(action, last_act),
+            "stand_still": lambda: reward_stand_still(commands, joint_angles, default_pose, 0.1),
+            "stand_still_joint_velocity": lambda: reward_stand_still(
+                commands, joint_vel, jp.zeros(12), stand_still_command_threshold
+            ),
+            "abduction_angle": lambda: reward_abduction_angle(
+                joint_angles, desired_abduction_angles=desired_abduction_angles
+            ),
+            "feet_air_time": lambda: reward_feet_air_time(
+                feet_air_time, first_contact, commands
+            ),
+            "foot_slip": lambda: reward_foot_slip(
+                pipeline_state,
+                contact_filt,
+                feet_site_id=feet_site_id,
+                foot_indices=foot_indices,
+            ),
+            "termination": lambda: reward_termination(
+                done, step, step_threshold=termination_step_threshold
+            ),
+            "knee_collision": lambda: reward_geom_collision(pipeline_state, knee_geom_ids),
+            "body_collision": lambda: reward_geom_collision(pipeline_state, body_geom_ids),
+        }
+        return {
+            k: terms[k]() * active[k] if k in active else jp.zeros(()) for k in scales
+        }
+
+    return compute_rewards
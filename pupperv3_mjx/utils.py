@@ -1,6 +1,7 @@
 from datetime import datetime
 import matplotlib.pyplot as plt
 import difflib
+import functools
 import re
 import xml.etree.ElementTree as ET
 from typing import List, Callable, Tuple
@@ -15,6 +16,24 @@ from orbax import checkpoint as ocp
 from pathlib import Path
 
 
+def enable_compilation_cache(
+    cache_dir: str = "~/.cache/pupperv3_jax", min_compile_time_secs: float = 1.0
+):
+    """
+    Enable JAX's persistent compilation cache so compiled programs (e.g. the environment step
+    and reward graph) are reused across runs instead of being recompiled from scratch.
+    Call this before the first jit compilation. Cache hits require the same shapes, dtypes
+    and static configuration as the run that populated the cache.
+
+    Args:
+    cache_dir (str): Directory to store compiled programs in.
+    min_compile_time_secs (float): Only cache programs that took at least this long to compile.
+    """
+    jax.config.update("jax_compilation_cache_dir", os.path.expanduser(cache_dir))
+    jax.config.update("jax_persistent_cache_min_entry_size_bytes", 0)
+    jax.config.update("jax_persistent_cache_min_compile_time_secs", min_compile_time_secs)
+
+
 def circular_buffer_push_back(buffer: jax.Array, new_value: jax.Array) -> jax.Array:
     """
     Shift a circular buffer back by one step and set the last element to a new value.
@@ -202,6 +221,64 @@ def save_checkpoint(current_step, make_policy, params, checkpoint_path: Path):
     wandb.log_model(path=path.as_posix(), name=f"checkpoint_{wandb.run.name}_{current_step}")
 
 
+def rollout_policy(
+    inference_fn: Callable,
+    step_fn: Callable,
+    state,
+    commands: jax.Array,
+    rng: jax.Array,
+):
+    """
+    Roll out a policy with jax.lax.scan so the whole rollout is a single compiled loop.
+
+    Args:
+    inference_fn (Callable): The policy, mapping (obs, rng) to (action, extras).
+    step_fn (Callable): The environment step function.
+    state (State): The initial environment state.
+    commands (jax.Array): The command to set before each step. Dimensions: (n_steps, 3).
+    rng (jax.Array): The random number generator key.
+
+    Returns:
+    Tuple[State, base.State, jax.Array]: The final state, the pipeline states after each step
+    stacked along the first axis, and the actions taken. Dimensions: (n_steps, ...).
+    """
+
+    def body(carry, command):
+        state, rng = carry
+        act_rng, rng = jax.random.split(rng)
+        state.info["command"] = command
+        ctrl, _ = inference_fn(state.obs, act_rng)
+        state = step_fn(state, ctrl)
+        return (state, rng), (state.pipeline_state, ctrl)
+
+    (state, _), (pipeline_states, ctrls) = jax.lax.scan(body, (state, rng), commands)
+    return state, pipeline_states, ctrls
+
+
+@functools.lru_cache(maxsize=None)
+def make_policy_rollout(make_policy: Callable, step_fn: Callable) -> Callable:
+    """
+    Build a jitted rollout_policy that takes the policy parameters as a traced argument.
+    The result is cached per (make_policy, step_fn), so rolling out a new checkpoint reuses
+    the compiled rollout instead of recompiling it with the weights baked in.
+    The initial state is donated so its buffers (including the last_act and last_vel carries)
+    are reused for the rollout; it must not be used after the call.
+
+    Args:
+    make_policy (Callable): Maps policy parameters to an inference function.
+    step_fn (Callable): The environment step function.
+
+    Returns:
+    Callable: rollout(policy_params, state, commands, rng) with the same outputs as
+    rollout_policy.
+    """
+
+    def rollout(policy_params, state, commands: jax.Array, rng: jax.Array):
+        return rollout_policy(make_policy(policy_params), step_fn, state, commands, rng)
+
+    return jax.jit(rollout, donate_argnums=(1,))
+
+
 def visualize_policy(
     current_step,
     make_policy,
@@ -230,9 +307,6 @@ def visualize_policy(
     wz (float): The rotational velocity.
     """
 
-    inference_fn = make_policy((params[0], params[1].policy))
-    jit_inference_fn = jax.jit(inference_fn)
-
     # Make robot go forward, back, left, right
     command_seq = jp.array(
         [
@@ -250,23 +324,20 @@ def visualize_policy(
     rng = jax.random.PRNGKey(0)
     state = jit_reset(rng)
     state.info["command"] = command_seq[0]
-    rollout = [state.pipeline_state]
 
-    # grab a trajectory
+    # grab a trajectory, changing command every 80 steps
     n_steps = 560
     render_every = 2
-    ctrls = []
-
-    for i in range(n_steps):
-        act_rng, rng = jax.random.split(rng)
-
-        # Change command every 80 steps
-        state.info["command"] = command_seq[int(i / 80)]
-
-        ctrl, _ = jit_inference_fn(state.obs, act_rng)
-        state = jit_step(state, ctrl)
-        rollout.append(state.pipeline_state)
-        ctrls.append(ctrl)
+    commands = jp.repeat(command_seq, n_steps // command_seq.shape[0], axis=0)
+
+    # The initial state is donated to the rollout, so keep a host copy of it to render
+    initial_pipeline_state = jax.device_get(state.pipeline_state)
+    jit_rollout = make_policy_rollout(make_policy, jit_step)
+    _, pipeline_states, _ = jit_rollout((params[0], params[1].policy), state, commands, rng)
+    pipeline_states = jax.device_get(pipeline_states)
+    rollout = [initial_pipeline_state] + [
+        jax.tree_util.tree_map(lambda x, i=i: x[i], pipeline_states) for i in range(n_steps)
+    ]
 
     filename = os.path.join(output_folder, f"step_{current_step}_policy.mp4")
     fps = int(1.0 / eval_env.dt / render_every)
@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+
+from brax import base, math
+import jax
+from jax import numpy as jp
+import numpy as np
+
+from pupperv3_mjx import rewards
+
+
+def test_reward_geom_collision():
+    contact = SimpleNamespace(
+        geom1=jp.array([0, 3, 5, 5, 7]),
+        geom2=jp.array([3, 4, 0, 9, 3]),
+        dist=jp.array([-0.01, -0.02, 0.01, -0.03, -0.01]),
+    )
+    pipeline_state = SimpleNamespace(contact=contact)
+
+    # Contact (0, 3) touches both geoms so it counts twice, (5, 0) is not penetrating
+    np.testing.assert_allclose(
+        rewards.reward_geom_collision(pipeline_state, np.array([0, 3])), 4.0
+    )
+    np.testing.assert_allclose(rewards.reward_geom_collision(pipeline_state, np.array([5])), 1.0)
+    np.testing.assert_allclose(rewards.reward_geom_collision(pipeline_state, np.array([8])), 0.0)
+
+
+def test_reward_foot_slip_matches_transform_do():
+    rng = np.random.default_rng(0)
+    # x and xd exclude the world body, so foot bodies 1..4 are at indices 0..3 after the torso
+    x = base.Transform.create(pos=jp.asarray(rng.normal(size=(5, 3)), dtype=jp.float32))
+    xd = base.Motion(
+        ang=jp.asarray(rng.normal(size=(5, 3)), dtype=jp.float32),
+        vel=jp.asarray(rng.normal(size=(5, 3)), dtype=jp.float32),
+    )
+    site_xpos = jp.asarray(rng.normal(size=(6, 3)), dtype=jp.float32)
+    pipeline_state = SimpleNamespace(x=x, xd=xd, site_xpos=site_xpos)
+    feet_site_id = jp.array([5, 1, 2, 4])
+    lower_leg_body_id = np.array([2, 3, 4, 5])
+    contact_filt = jp.array([True, False, True, True])
+
+    # Previous formulation through brax's Transform.do, with xpos including the world body
+    xpos = jp.concatenate([jp.zeros((1, 3)), x.pos])
+    offset = base.Transform.create(pos=site_xpos[feet_site_id] - xpos[lower_leg_body_id])
+    foot_vel = offset.vmap().do(xd.take(lower_leg_body_id - 1)).vel
+    expected = jp.sum(jp.square(foot_vel[:, :2]) * contact_filt.reshape((-1, 1)))
+
+    slip = rewards.reward_foot_slip(
+        pipeline_state, contact_filt, feet_site_id, foot_indices=jp.asarray(lower_leg_body_id - 1)
+    )
+    assert 0.0 < expected < 1000.0
+    np.testing.assert_allclose(slip, expected, rtol=1e-5)
+
+
+def test_qrot_matches_brax_rotate():
+    q = math.euler_to_quat(jp.array([20.0, -35.0, 110.0]))
+    v = jp.array([0.3, -1.2, 0.7])
+    np.testing.assert_allclose(rewards._qrot(q, v), math.rotate(v, q), atol=1e-6)
+    np.testing.assert_allclose(
+        rewards._qrot_inv(q, v), math.rotate(v, math.quat_inv(q)), atol=1e-6
+    )
+
+
+def make_test_reward_fn(scales):
+    return rewards.make_reward_fn(
+        scales,
+        tracking_sigma=0.25,
+        dt=0.02,
+        default_pose=jp.zeros(12),
+        desired_abduction_angles=jp.zeros(4),
+        stand_still_command_threshold=0.1,
+        termination_step_threshold=500,
+        feet_site_id=np.arange(4),
+        foot_indices=np.arange(4),
+        knee_geom_ids=np.arange(4),
+        body_geom_ids=np.arange(1),
+    )
+
+
+def make_test_reward_inputs(done, step):
+    # No site_xpos: tracing the foot slip term would raise an AttributeError
+    pipeline_state = SimpleNamespace(
+        x=SimpleNamespace(rot=jp.array([[1.0, 0.0, 0.0, 0.0]])),
+        xd=SimpleNamespace(vel=jp.zeros((1, 3)), ang=jp.zeros((1, 3))),
+    )
+    zeros = jp.zeros(12)
+    return dict(
+        pipeline_state=pipeline_state,
+        action=zeros,
+        last_act=zeros,
+        joint_angles=zeros,
+        joint_vel=zeros,
+        last_joint_vel=zeros,
+        commands=jp.zeros(3),
+        desired_world_z_in_body_frame=jp.array([0.0, 0.0, 1.0]),
+        feet_air_time=jp.zeros(4),
+        first_contact=jp.zeros(4, dtype=bool),
+        contact_filt=jp.zeros(4, dtype=bool),
+        done=done,
+        step=step,
+    )
+
+
+def test_make_reward_fn_skips_zero_scales():
+    compute_rewards = make_test_reward_fn({"termination": -2.0, "foot_slip": 0.0})
+    rewards_dict = compute_rewards(**make_test_reward_inputs(jp.array(True), jp.array(3)))
+    assert set(rewards_dict) == {"termination", "foot_slip"}
+    np.testing.assert_allclose(rewards_dict["termination"], -2.0)
+    np.testing.assert_allclose(rewards_dict["foot_slip"], 0.0)
+
+
+def test_make_reward_fn_vmap():
+    compute_rewards = make_test_reward_fn(
+        {"termination": -2.0, "tracking_lin_vel": 1.0, "foot_slip": 0.0}
+    )
+    inputs = make_test_reward_inputs(done=None, step=None)
+
+    def env_rewards(done, step, commands):
+        return compute_rewards(**dict(inputs, done=done, step=step, commands=commands))
+
+    batched_rewards = jax.jit(jax.vmap(env_rewards))
+    rewards_dict = batched_rewards(
+        jp.array([True, True, False]),
+        jp.array([3, 600, 3]),
+        jp.array([[0.0, 0.0, 0.0], [0.5, 0.0, 0.0], [0.0, 0.5, 0.0]]),
+    )
+    np.testing.assert_allclose(rewards_dict["termination"], [-2.0, 0.0, 0.0])
+    np.testing.assert_allclose(
+        rewards_dict["tracking_lin_vel"], [1.0, np.exp(-1.0), np.exp(-1.0)], rtol=1e-5
+    )
+    # Disabled terms are broadcast to the batch like the active ones
+    np.testing.assert_allclose(rewards_dict["foot_slip"], np.zeros(3))
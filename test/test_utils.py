@@ -2,10 +2,13 @@ import pytest
 import jax
 from jax import numpy as jp
 import numpy as np
+from brax.envs.base import State
 from pupperv3_mjx.utils import (
     activation_fn_map,
     circular_buffer_push_back,
     circular_buffer_push_front,
+    make_policy_rollout,
+    rollout_policy,
     sample_lagged_value,
 )
 
@@ -106,3 +109,64 @@ def test_sample_lagged_value_buffer_size_one():
 
     # Check that the sampled action is within the expected range
     assert jp.allclose(sampled_value, expected_value, atol=1e-5)
+
+
+def toy_step_fn(state, action):
+    # Toy env: the pipeline state integrates the command plus the action
+    pipeline_state = state.pipeline_state + state.info["command"] + action
+    state.info["last_vel"] = pipeline_state - state.pipeline_state
+    state.info["last_act"] = action
+    return state.replace(pipeline_state=pipeline_state, obs=pipeline_state)
+
+
+def toy_make_policy(params):
+    return lambda obs, rng: (params * jp.ones(3), {})
+
+
+def toy_state():
+    return State(
+        pipeline_state=jp.zeros(3),
+        obs=jp.zeros(3),
+        reward=jp.zeros(()),
+        done=jp.zeros(()),
+        metrics={},
+        info={"command": jp.zeros(3), "last_act": jp.zeros(3), "last_vel": jp.zeros(3)},
+    )
+
+
+def test_rollout_policy():
+    commands = jp.repeat(jp.array([[1.0, 0.0, 0.0], [0.0, 2.0, 0.0]]), 2, axis=0)
+    final_state, pipeline_states, ctrls = jax.jit(rollout_policy, static_argnums=(0, 1))(
+        toy_make_policy(1.0), toy_step_fn, toy_state(), commands, jax.random.PRNGKey(0)
+    )
+
+    expected = jp.cumsum(commands + 1.0, axis=0)
+    np.testing.assert_allclose(pipeline_states, expected)
+    np.testing.assert_allclose(final_state.pipeline_state, expected[-1])
+    np.testing.assert_allclose(final_state.info["command"], commands[-1])
+    assert ctrls.shape == (4, 3)
+
+
+def test_make_policy_rollout_reuses_compilation():
+    rollout = make_policy_rollout(toy_make_policy, toy_step_fn)
+    assert make_policy_rollout(toy_make_policy, toy_step_fn) is rollout
+
+    commands = jp.ones((4, 3))
+    for params in [1.0, 3.0]:
+        _, pipeline_states, _ = rollout(
+            jp.float32(params), toy_state(), commands, jax.random.PRNGKey(0)
+        )
+        np.testing.assert_allclose(pipeline_states[-1], 4.0 * (1.0 + params) * jp.ones(3))
+    # New parameters are a traced argument, not a recompilation
+    assert rollout._cache_size() == 1
+
+
+def test_make_policy_rollout_donates_initial_state():
+    rollout = make_policy_rollout(toy_make_policy, toy_step_fn)
+    state = toy_state()
+    final_state, _, _ = rollout(jp.float32(1.0), state, jp.ones((4, 3)), jax.random.PRNGKey(0))
+
+    assert state.info["last_act"].is_deleted()
+    assert state.info["last_vel"].is_deleted()
+    np.testing.assert_allclose(final_state.info["last_act"], jp.ones(3))
+    np.testing.assert_allclose(final_state.info["last_vel"], 2.0 * jp.ones(3))